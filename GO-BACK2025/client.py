@@ -8,10 +8,22 @@ import struct
 import time
 import threading
 import random
+import selectors
+import queue
 from datetime import datetime
 
+import mmsg
+
 class GBNClient:
-    def __init__(self, server_host='localhost', server_port=8080, window_size=4, timeout=2.0, packet_loss_rate=0.1):
+    # Attributi fissi: i contatori sul percorso critico sono slot invece di chiavi di un dict
+    __slots__ = (
+        'server_addr', 'window_size', 'timeout', 'packet_loss_rate',
+        'base', 'next_seq', 'socket', 'running', 'deadline', 'timer_thread', 'ack_thread',
+        'packets_sent', 'packets_lost', 'retransmissions', 'acks_received', 'timeouts', 'total_packets',
+        'packets', 'cond', 'done', 'verbose', 'log_queue', 'log_thread',
+    )
+    
+    def __init__(self, server_host='localhost', server_port=8080, window_size=4, timeout=2.0, packet_loss_rate=0.1, verbose=True):
         # Configurazione connessione
         self.server_addr = (server_host, server_port)
         self.window_size = window_size  # Dimensione della finestra di trasmissione
@@ -23,52 +35,122 @@ class GBNClient:
         self.next_seq = 0    # Prossimo numero di sequenza da inviare
         self.socket = None
         self.running = False
-        self.timer_active = False
+        self.deadline = None     # Scadenza del timer (time.monotonic), None se fermo
         self.timer_thread = None
         self.ack_thread = None
         
         # Statistiche per monitoraggio prestazioni
-        self.stats = {
-            'packets_sent': 0,
-            'packets_lost': 0,
-            'retransmissions': 0,
-            'acks_received': 0,
-            'timeouts': 0,
-            'total_packets': 0
-        }
+        self.packets_sent = 0
+        self.packets_lost = 0
+        self.retransmissions = 0
+        self.acks_received = 0
+        self.timeouts = 0
+        self.total_packets = 0
+        
+        # Pacchetti già codificati, indicizzati per numero di sequenza.
+        # Quelli non confermati sono sempre l'intervallo [base, next_seq)
+        self.packets = []
         
-        # Buffer per memorizzare i dati dei pacchetti
-        self.packet_data = {}    # Dati originali per ritrasmissione
-        self.sent_packets = {}   # Pacchetti già inviati
+        # Condition per sincronizzazione thread: notificata quando la finestra si sposta
+        self.cond = threading.Condition()
         
-        # Lock per sincronizzazione thread
-        self.lock = threading.Lock()
+        # Evento impostato quando la trasmissione termina (tutti confermati o client fermato)
+        self.done = threading.Event()
+        
+        # Log asincrono: i thread del protocollo accodano, un thread dedicato formatta e stampa
+        self.verbose = verbose
+        self.log_queue = queue.SimpleQueue()
+        self.log_thread = None
+        
+    @property
+    def stats(self):
+        """Statistiche della trasmissione raccolte in un dict"""
+        return {
+            'packets_sent': self.packets_sent,
+            'packets_lost': self.packets_lost,
+            'retransmissions': self.retransmissions,
+            'acks_received': self.acks_received,
+            'timeouts': self.timeouts,
+            'total_packets': self.total_packets
+        }
         
     def log(self, message):
-        """Stampa messaggi con timestamp per debugging"""
-        timestamp = datetime.now().strftime("%H:%M:%S.%f")[:-3]
-        print(f"[CLIENT {timestamp}] {message}")
+        """Accoda un messaggio con timestamp per debugging"""
+        if self.verbose:
+            self.log_queue.put_nowait((time.time(), message))
+            
+    def log_error(self, message):
+        """Riporta un errore, sempre, indipendentemente da verbose"""
+        if self.log_thread and self.log_thread.is_alive():
+            self.log_queue.put_nowait((time.time(), message))
+        else:
+            timestamp = datetime.now().strftime("%H:%M:%S.%f")[:-3]
+            print(f"[CLIENT {timestamp}] {message}")
+        
+    def log_writer(self):
+        """Thread dedicato che stampa i messaggi accodati da log()"""
+        while True:
+            item = self.log_queue.get()
+            if item is None:
+                return
+            created, message = item
+            timestamp = datetime.fromtimestamp(created).strftime("%H:%M:%S.%f")[:-3]
+            print(f"[CLIENT {timestamp}] {message}")
+            
+    def flush_log(self):
+        """Stampa i messaggi ancora in coda e ferma il thread di log"""
+        if self.log_thread and self.log_thread.is_alive():
+            self.log_queue.put_nowait(None)
+            self.log_thread.join()
         
     def start(self, num_packets=20):
         """Avvia il client e inizia la trasmissione"""
         try:
+            # Avvia thread che stampa i messaggi di log (gli errori vengono stampati anche se verbose=False)
+            self.log_thread = threading.Thread(target=self.log_writer)
+            self.log_thread.daemon = True
+            self.log_thread.start()
+            
             # Inizializza socket UDP
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            self.socket.settimeout(0.1)  # Timeout non-bloccante per receive
+            
+            # Buffer di invio/ricezione più grandi per non perdere datagrammi durante le raffiche
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4_000_000)
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4_000_000)
+            
+            self.socket.setblocking(False)  # La ricezione attende tramite selector
+            
+            # Risolve l'indirizzo una sola volta e collega il socket al server:
+            # gli invii non devono più passare l'indirizzo ad ogni chiamata
+            ip = socket.gethostbyname(self.server_addr[0])
+            self.server_addr = (ip, self.server_addr[1])
+            self.socket.connect(self.server_addr)
+            
             self.running = True
-            self.stats['total_packets'] = num_packets
+            self.total_packets = num_packets
+            
+            # Codifica tutti i pacchetti una sola volta, riusati per invio e ritrasmissione
+            self.packets = [struct.pack('!I', seq_num) + f"Messaggio {seq_num:03d}".encode('utf-8')
+                            for seq_num in range(num_packets)]
             
             # Log configurazione
             self.log(f"Client avviato - Server: {self.server_addr}")
             self.log(f"Finestra: {self.window_size}, Timeout: {self.timeout}s")
             self.log(f"Perdita pacchetti: {self.packet_loss_rate*100}%")
             self.log(f"Pacchetti da inviare: {num_packets}")
+            self.log(f"Buffer socket: invio {self.socket.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF)} B, "
+                     f"ricezione {self.socket.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)} B")
             
             # Avvia thread per ricezione ACK
             self.ack_thread = threading.Thread(target=self.receive_acks)
             self.ack_thread.daemon = True
             self.ack_thread.start()
             
+            # Avvia l'unico thread che gestisce i timeout
+            self.timer_thread = threading.Thread(target=self.timer_loop)
+            self.timer_thread.daemon = True
+            self.timer_thread.start()
+            
             # Inizia invio pacchetti
             self.send_packets(num_packets)
             
@@ -76,77 +158,122 @@ class GBNClient:
             self.wait_for_completion()
             
         except Exception as e:
-            self.log(e)
+            self.log_error(e)
         finally:
             self.stop()
             
     def send_packets(self, num_packets):
         """Invia pacchetti seguendo il protocollo Go-Back-N"""
         while self.base < num_packets and self.running:
-            with self.lock:
-                # Invia pacchetti finché la finestra non è piena
+            with self.cond:
+                # Prepara i pacchetti finché la finestra non è piena
+                batch = []
                 while (self.next_seq < self.base + self.window_size and 
                        self.next_seq < num_packets and self.running):
-                    self.send_packet(self.next_seq)
+                    if not self.simulate_loss(self.next_seq):
+                        batch.append(self.next_seq)
                     self.next_seq += 1
                     
+                # Invia l'intera finestra con una sola system call
+                sent = self.send_batch(batch)
+                self.packets_sent += sent
+                if self.verbose:
+                    for seq_num in batch[:sent]:
+                        self.log(f"Inviato pacchetto #{seq_num}: '{self.packets[seq_num][4:].decode('utf-8')}'")
+                    
                 # Avvia timer se non è già attivo e ci sono pacchetti in attesa
-                if not self.timer_active and self.base < self.next_seq:
+                if self.deadline is None and self.base < self.next_seq:
                     self.start_timer()
                     
-            time.sleep(0.1)  # Piccola pausa per evitare busy waiting
-            
-    def send_packet(self, seq_num):
-        """Invia un singolo pacchetto con numero di sequenza specificato"""
-        try:
-            # Crea payload del pacchetto
-            payload = f"Messaggio {seq_num:03d}"
-            packet = struct.pack('!I', seq_num) + payload.encode('utf-8')
+                # Attende che un ACK sposti la finestra invece di fare polling
+                if self.base < num_packets and self.running:
+                    self.cond.wait(timeout=self.timeout)
             
-            # Memorizza dati per eventuale ritrasmissione
-            self.packet_data[seq_num] = packet
-            
-            # Simula perdita casuale del pacchetto
-            if random.random() <= self.packet_loss_rate:
-                self.stats['packets_lost'] += 1
-                self.log(f"Pacchetto #{seq_num} perso (simulato)")
-                return
-                
-            # Invia pacchetto al server
-            self.socket.sendto(packet, self.server_addr)
+    def simulate_loss(self, seq_num):
+        """Simula la perdita casuale di un pacchetto, ritorna True se è perso"""
+        if random.random() <= self.packet_loss_rate:
+            self.packets_lost += 1
+            self.log(f"Pacchetto #{seq_num} perso (simulato)")
+            return True
             
-            # Memorizza pacchetto inviato
-            self.sent_packets[seq_num] = packet
-            
-            # Aggiorna statistiche
-            self.stats['packets_sent'] += 1
-            self.log(f"Inviato pacchetto #{seq_num}: '{payload}'")
+        return False
+        
+    def send_batch(self, seq_nums):
+        """Invia un gruppo di pacchetti, con sendmmsg se disponibile. Ritorna quanti sono partiti"""
+        if not seq_nums:
+            return 0
             
+        packets = [self.packets[seq_num] for seq_num in seq_nums]
+        sent = 0
+        try:
+            if mmsg.AVAILABLE:
+                sent = mmsg.sendmmsg(self.socket, packets)
+            else:
+                for packet in packets:
+                    self.socket.send(packet)
+                    sent += 1
+        except ConnectionRefusedError as e:
+            # Server non raggiungibile (ICMP port unreachable): come una perdita, ci pensa il timeout
+            sent = getattr(e, 'sent', sent)
+            self.log(f"Server non raggiungibile, pacchetti #{seq_nums[sent]}-{seq_nums[-1]} persi")
         except Exception as e:
-            self.log(f"Errore nell'invio pacchetto #{seq_num}: {e}")
+            sent = getattr(e, 'sent', sent)
+            self.log_error(f"Errore nell'invio pacchetti #{seq_nums[sent]}-{seq_nums[-1]}: {e}")
             
+        return sent
+        
     def receive_acks(self):
         """Thread separato per ricevere ACK dal server"""
-        while self.running:
-            try:
-                data, _ = self.socket.recvfrom(1024)
-                
-                # Verifica che sia un ACK valido (4 bytes)
-                if len(data) == 4:
-                    ack_num = struct.unpack('!I', data)[0]
-                    self.handle_ack(ack_num)
+        # Il thread resta bloccato nel kernel (epoll su Linux) finché non arrivano dati
+        recv_buffer = mmsg.RecvBuffer() if mmsg.AVAILABLE else None
+        
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.socket, selectors.EVENT_READ)
+            
+            while self.running:
+                try:
+                    if not selector.select(timeout=0.5):
+                        continue  # Nessun dato, ricontrolla self.running
+                        
+                    # Verifica che siano ACK validi (4 bytes)
+                    acks = [struct.unpack('!I', data)[0]
+                            for data in self.drain_socket(recv_buffer) if len(data) == 4]
                     
-            except socket.timeout:
-                continue  # Timeout normale, continua
-            except Exception as e:
-                if self.running:
-                    self.log(f"Errore nella ricezione ACK: {e}")
+                    # Gli ACK sono cumulativi: basta gestire il più alto del blocco
+                    if acks:
+                        self.handle_ack(max(acks), len(acks))
+                            
+                except Exception as e:
+                    if self.running:
+                        self.log_error(f"Errore nella ricezione ACK: {e}")
+                        
+    def drain_socket(self, recv_buffer):
+        """Legge tutti i datagrammi in attesa, a blocchi con recvmmsg se disponibile"""
+        datagrams = []
+        while True:
+            try:
+                if recv_buffer is not None:
+                    batch = mmsg.recvmmsg(self.socket, recv_buffer)
+                    datagrams.extend(batch)
+                    if len(batch) < recv_buffer.vlen:
+                        return datagrams  # Socket svuotato
+                else:
+                    data, _ = self.socket.recvfrom(1024)
+                    datagrams.append(data)
+            except BlockingIOError:
+                return datagrams
+            except ConnectionRefusedError:
+                # ICMP port unreachable su socket connesso: il datagramma è perso, non è un errore
+                continue
                     
-    def handle_ack(self, ack_num):
-        """Gestisce la ricezione di un ACK"""
-        with self.lock:
-            self.log(f"Ricevuto ACK #{ack_num}")
-            self.stats['acks_received'] += 1
+    def handle_ack(self, ack_num, count=1):
+        """Gestisce la ricezione di un ACK (o di count ACK, di cui ack_num è il più alto)"""
+        with self.cond:
+            if count == 1:
+                self.log(f"Ricevuto ACK #{ack_num}")
+            else:
+                self.log(f"Ricevuti {count} ACK, il più alto è #{ack_num}")
+            self.acks_received += count
             
             # ACK cumulativo: conferma tutti i pacchetti fino ad ack_num
             if ack_num >= self.base:
@@ -154,30 +281,40 @@ class GBNClient:
                 self.base = ack_num + 1  # Sposta la finestra
                 
                 self.log(f"Finestra spostata: base {old_base} -> {self.base}")
+                self.cond.notify_all()  # Risveglia chi attende la finestra
+                if self.base >= self.total_packets:
+                    self.done.set()
                 
-                # Rimuove pacchetti confermati dai buffer
-                for seq in list(self.sent_packets.keys()):
-                    if seq <= ack_num:
-                        del self.sent_packets[seq]
-                        
-                for seq in list(self.packet_data.keys()):
-                    if seq <= ack_num:
-                        del self.packet_data[seq]
-                        
                 # Gestisce timer
                 if self.base < self.next_seq:
                     self.restart_timer()  # Ci sono ancora pacchetti in attesa
                 else:
                     self.stop_timer()     # Tutti i pacchetti confermati
                     
+    def timer_loop(self):
+        """Thread unico per il timer: dorme fino alla scadenza e gestisce il timeout"""
+        with self.cond:
+            while self.running:
+                if self.deadline is None:
+                    self.cond.wait()  # Timer fermo, attende un start_timer
+                    continue
+                    
+                remaining = self.deadline - time.monotonic()
+                if remaining > 0:
+                    self.cond.wait(timeout=remaining)  # La scadenza può essere spostata nel frattempo
+                    continue
+                    
+                self.handle_timeout()
+                
+        self.done.set()  # Client fermato: sblocca wait_for_completion
+                
     def start_timer(self):
         """Avvia il timer per timeout"""
-        if self.timer_active:
+        if self.deadline is not None:
             return
             
-        self.timer_active = True
-        self.timer_thread = threading.Timer(self.timeout, self.handle_timeout)
-        self.timer_thread.start()
+        self.deadline = time.monotonic() + self.timeout
+        self.cond.notify_all()  # Risveglia il thread del timer
         self.log(f"Timer avviato ({self.timeout}s)")
         
     def restart_timer(self):
@@ -187,92 +324,84 @@ class GBNClient:
         
     def stop_timer(self):
         """Ferma il timer attivo"""
-        if self.timer_active and self.timer_thread:
-            self.timer_thread.cancel()
-            self.timer_active = False
+        if self.deadline is not None:
+            self.deadline = None
             self.log("Timer fermato")
             
     def handle_timeout(self):
         """Gestisce il timeout - ritrasmette tutti i pacchetti non confermati"""
-        with self.lock:
+        with self.cond:
             if not self.running:
                 return
                 
-            self.stats['timeouts'] += 1
+            self.timeouts += 1
             self.log(f"TIMEOUT! Ritrasmetto pacchetti {self.base}-{self.next_seq-1}")
             
             # Ritrasmette tutti i pacchetti nella finestra corrente
-            for seq_num in range(self.base, self.next_seq):
-                if seq_num in self.packet_data:
-                    try:
-                        # Rinvia il pacchetto
-                        self.socket.sendto(self.packet_data[seq_num], self.server_addr)
-                        self.sent_packets[seq_num] = self.packet_data[seq_num]
-                        
-                        self.stats['retransmissions'] += 1
-                        self.log(f"Ritrasmesso pacchetto #{seq_num}")
-                        
-                    except Exception as e:
-                        self.log(f"Errore ritrasmissione #{seq_num}: {e}")
-                else:
-                    self.log(f"Dati pacchetto #{seq_num} non trovati!")
+            batch = list(range(self.base, self.next_seq))
+            sent = self.send_batch(batch)
+            self.retransmissions += sent
+            if self.verbose:
+                for seq_num in batch[:sent]:
+                    self.log(f"Ritrasmesso pacchetto #{seq_num}")
                     
             # Riavvia il timer per il prossimo possibile timeout
-            self.timer_active = False
+            self.deadline = None
             self.start_timer()
             
     def wait_for_completion(self):
         """Attende che tutti i pacchetti siano confermati"""
         self.log("Attendo conferma di tutti i pacchetti...")
         
-        start_time = time.time()
         max_wait = 30  # Timeout massimo di attesa
         
         # Aspetta finché tutti i pacchetti non sono confermati
-        while self.base < self.stats['total_packets'] and self.running:
-            time.sleep(0.1)
-            
-            # Controlla timeout massimo
-            if time.time() - start_time > max_wait:
+        if self.base < self.total_packets and self.running:
+            if not self.done.wait(timeout=max_wait):
                 self.log("Timeout massimo raggiunto!")
-                break
                 
         # Controlla risultato finale
-        if self.base >= self.stats['total_packets']:
+        if self.base >= self.total_packets:
             self.log("Tutti i pacchetti sono stati confermati!")
         else:
-            self.log(f"Completato parzialmente: {self.base}/{self.stats['total_packets']} pacchetti")
+            self.log(f"Completato parzialmente: {self.base}/{self.total_packets} pacchetti")
             
     def stop(self):
         """Ferma il client e pulisce le risorse"""
         self.running = False
-        self.stop_timer()
+        
+        with self.cond:
+            self.stop_timer()
+            self.cond.notify_all()  # Sblocca eventuali thread in attesa
+        self.done.set()
         
         if self.socket:
             self.socket.close()
             
+        self.flush_log()
         self.print_stats()
         
     def print_stats(self):
         """Stampa statistiche finali della trasmissione"""
+        stats = self.stats
         print("\n" + "="*50)
         print("STATISTICHE CLIENT")
         print("="*50)
-        print(f"Pacchetti da inviare: {self.stats['total_packets']}")
-        print(f"Pacchetti inviati: {self.stats['packets_sent']}")
+        print(f"Pacchetti da inviare: {stats['total_packets']}")
+        print(f"Pacchetti inviati: {stats['packets_sent']}")
         print(f"Pacchetti confermati: {self.base}")
-        print(f"Pacchetti persi (simulati): {self.stats['packets_lost']}")
-        print(f"ACK ricevuti: {self.stats['acks_received']}")
-        print(f"Ritrasmissioni: {self.stats['retransmissions']}")
-        print(f"Timeout: {self.stats['timeouts']}")
+        print(f"Pacchetti persi (simulati): {stats['packets_lost']}")
+        print(f"ACK ricevuti: {stats['acks_received']}")
+        print(f"Ritrasmissioni: {stats['retransmissions']}")
+        print(f"Timeout: {stats['timeouts']}")
         
         # Calcola percentuali di performance
-        if self.stats['total_packets'] > 0:
-            success_rate = (self.base / self.stats['total_packets']) * 100
+        if stats['total_packets'] > 0:
+            success_rate = (self.base / stats['total_packets']) * 100
             print(f"Tasso di successo: {success_rate:.1f}%")
             
-        if self.stats['packets_sent'] > 0:
-            retrans_rate = (self.stats['retransmissions'] / self.stats['packets_sent']) * 100
+        if stats['packets_sent'] > 0:
+            retrans_rate = (stats['retransmissions'] / stats['packets_sent']) * 100
             print(f"Tasso ritrasmissioni: {retrans_rate:.1f}%")
 
 def main():
@@ -283,9 +412,10 @@ def main():
     TIMEOUT = 2.0               # Timeout in secondi
     PACKET_LOSS_RATE = 0.1      # 10% di perdita pacchetti simulata
     NUM_PACKETS = 15            # Numero totale di pacchetti da inviare
+    VERBOSE = True              # False disattiva i log dettagliati
     
     # Crea e avvia il client
-    client = GBNClient(SERVER_HOST, SERVER_PORT, WINDOW_SIZE, TIMEOUT, PACKET_LOSS_RATE)
+    client = GBNClient(SERVER_HOST, SERVER_PORT, WINDOW_SIZE, TIMEOUT, PACKET_LOSS_RATE, VERBOSE)
     
     try:
         client.start(NUM_PACKETS)
@@ -0,0 +1,106 @@
+"""
+Go-Back-N ARQ Protocol - Invio e ricezione a blocchi con sendmmsg(2)/recvmmsg(2)
+Wrapper ctypes che permettono di spedire e ricevere più datagrammi UDP con una sola system call (solo Linux)
+"""
+
+import ctypes
+import platform
+import socket
+import errno
+import os
+
+class IOVec(ctypes.Structure):
+    """struct iovec: puntatore e lunghezza di un buffer"""
+    _fields_ = [
+        ('iov_base', ctypes.c_void_p),
+        ('iov_len', ctypes.c_size_t),
+    ]
+
+class MsgHdr(ctypes.Structure):
+    """struct msghdr: descrive un singolo datagramma"""
+    _fields_ = [
+        ('msg_name', ctypes.c_void_p),
+        ('msg_namelen', ctypes.c_uint32),
+        ('msg_iov', ctypes.POINTER(IOVec)),
+        ('msg_iovlen', ctypes.c_size_t),
+        ('msg_control', ctypes.c_void_p),
+        ('msg_controllen', ctypes.c_size_t),
+        ('msg_flags', ctypes.c_int),
+    ]
+
+class MMsgHdr(ctypes.Structure):
+    """struct mmsghdr: elemento dell'array passato a sendmmsg/recvmmsg"""
+    _fields_ = [
+        ('msg_hdr', MsgHdr),
+        ('msg_len', ctypes.c_uint),
+    ]
+
+# Carica sendmmsg/recvmmsg dalla libc, disponibili solo su Linux
+libc = None
+if platform.system() == 'Linux':
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.sendmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int]
+        libc.sendmmsg.restype = ctypes.c_int
+        libc.recvmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+        libc.recvmmsg.restype = ctypes.c_int
+    except (OSError, AttributeError):
+        libc = None
+
+AVAILABLE = libc is not None
+
+def sendmmsg(sock, packets):
+    """Invia tutti i pacchetti sul socket connesso con il minor numero possibile di sendmmsg.
+    In caso di errore l'OSError sollevato ha l'attributo sent: i pacchetti partiti prima dell'errore"""
+    count = len(packets)
+    if count == 0:
+        return 0
+
+    # Costruisce l'array di mmsghdr che punta direttamente ai byte dei pacchetti
+    buffers = [ctypes.c_char_p(packet) for packet in packets]
+    iovecs = (IOVec * count)()
+    msgs = (MMsgHdr * count)()
+    for i, packet in enumerate(packets):
+        iovecs[i].iov_base = ctypes.cast(buffers[i], ctypes.c_void_p)
+        iovecs[i].iov_len = len(packet)
+        hdr = msgs[i].msg_hdr
+        hdr.msg_iov = ctypes.pointer(iovecs[i])
+        hdr.msg_iovlen = 1
+
+    # sendmmsg può inviare solo una parte dei messaggi: riprova dal primo non inviato
+    sent = 0
+    while sent < count:
+        result = libc.sendmmsg(sock.fileno(), ctypes.addressof(msgs) + sent * ctypes.sizeof(MMsgHdr),
+                               count - sent, 0)
+        if result < 0:
+            err = ctypes.get_errno()
+            error = OSError(err, os.strerror(err))
+            error.sent = sent
+            raise error
+        sent += result
+    return sent
+
+class RecvBuffer:
+    """Array di mmsghdr allocato una sola volta e riusato da ogni chiamata a recvmmsg"""
+    def __init__(self, vlen=32, size=16):
+        self.vlen = vlen
+        self.buffers = [ctypes.create_string_buffer(size) for _ in range(vlen)]
+        self.iovecs = (IOVec * vlen)()
+        self.msgs = (MMsgHdr * vlen)()
+        for i, buffer in enumerate(self.buffers):
+            self.iovecs[i].iov_base = ctypes.addressof(buffer)
+            self.iovecs[i].iov_len = size
+            self.msgs[i].msg_hdr.msg_iov = ctypes.pointer(self.iovecs[i])
+            self.msgs[i].msg_hdr.msg_iovlen = 1
+
+def recvmmsg(sock, recv_buffer):
+    """Legge fino a recv_buffer.vlen datagrammi con una sola recvmmsg, senza bloccare"""
+    result = libc.recvmmsg(sock.fileno(), ctypes.addressof(recv_buffer.msgs), recv_buffer.vlen,
+                           socket.MSG_DONTWAIT, None)
+    if result < 0:
+        err = ctypes.get_errno()
+        if err in (errno.EAGAIN, errno.EWOULDBLOCK):
+            return []
+        raise OSError(err, os.strerror(err))
+        
+    return [recv_buffer.buffers[i].raw[:recv_buffer.msgs[i].msg_len] for i in range(result)]
@@ -8,8 +8,16 @@ import signal
 import sys
 import os
 import re
-import threading
-import queue
+import asyncio
+import ipaddress
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import icmplib
+except ImportError:
+    icmplib = None
+
+use_icmplib = icmplib is not None
 
 class Colors:
     GREEN = '\033[92m'
@@ -29,36 +37,50 @@ def get_hostname(ip):
         return None
 
 def validate_ip(ip):
-    ipv4_pattern = re.compile(r'^(\d{1,3})\.(\d{1,3})\.(\d{1,3})\.(\d{1,3})$')
-    if ipv4_pattern.match(ip):
-        return all(0 <= int(num) <= 255 for num in ip.split('.'))
-    return False
+    try:
+        ipaddress.ip_address(ip)
+        return True
+    except ValueError:
+        return False
 
 def ping(host, timeout=2):
-    system = platform.system().lower()
-    if system == 'windows':
-        command = ['ping', '-n', '1', '-w', str(timeout * 1000), host]
-    else: 
-        command = ['ping', '-c', '1', '-W', str(timeout), host]
+    global use_icmplib
+    if use_icmplib:
+        try:
+            result = icmplib.ping(host, count=1, timeout=timeout, privileged=False)
+            if result.is_alive:
+                return True, result.avg_rtt
+            return False, 0.0
+        except icmplib.ICMPSocketError:
+            use_icmplib = False
+        except Exception as e:
+            print(f"{host}: {e}")
+            return False, 0.0
+    return subprocess_ping(host, timeout)
+
+def ping_command(host, timeout):
+    if platform.system().lower() == 'windows':
+        return ['ping', '-n', '1', '-w', str(timeout * 1000), host]
+    return ['ping', '-c', '1', '-W', str(timeout), host]
+
+def parse_response_time(stdout, elapsed_time):
+    if platform.system().lower() == 'windows':
+        match = re.search(r'tempo=(\d+)ms', stdout)
+    else:
+        match = re.search(r'time=([\d\.]+) ms', stdout)
+    if match:
+        return float(match.group(1))
+    return elapsed_time * 1000
+
+def subprocess_ping(host, timeout=2):
+    command = ping_command(host, timeout)
     try:
         start_time = time.time()
-        output = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, 
+        output = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, 
                               timeout=timeout+1, text=True)
         elapsed_time = time.time() - start_time
         if output.returncode == 0:
-            response_time = None
-            if system == 'windows':
-                match = re.search(r'tempo=(\d+)ms', output.stdout)
-                if match:
-                    response_time = float(match.group(1))
-            else:
-                match = re.search(r'time=([\d\.]+) ms', output.stdout)
-                if match:
-                    response_time = float(match.group(1))
-            if response_time is None:
-                response_time = elapsed_time * 1000
-                
-            return True, response_time
+            return True, parse_response_time(output.stdout, elapsed_time)
         else:
             return False, 0.0
             
@@ -68,32 +90,60 @@ def ping(host, timeout=2):
         print(f"{host}: {e}")
         return False, 0.0
 
-def parallel_ping(hosts, timeout=2, max_workers=10):
-    results = {}
-    result_queue = queue.Queue()
+async def async_ping(host, timeout=2):
+    global use_icmplib
+    if use_icmplib:
+        try:
+            result = await icmplib.async_ping(host, count=1, timeout=timeout, privileged=False)
+            if result.is_alive:
+                return True, result.avg_rtt
+            return False, 0.0
+        except icmplib.ICMPSocketError:
+            use_icmplib = False
+        except Exception as e:
+            print(f"{host}: {e}")
+            return False, 0.0
+    return await async_subprocess_ping(host, timeout)
+
+async def async_subprocess_ping(host, timeout=2):
+    command = ping_command(host, timeout)
+    try:
+        start_time = time.time()
+        process = await asyncio.create_subprocess_exec(*command, stdout=subprocess.PIPE,
+                                                       stderr=subprocess.DEVNULL)
+        try:
+            stdout, _ = await asyncio.wait_for(process.communicate(), timeout=timeout+1)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            return False, 0.0
+        elapsed_time = time.time() - start_time
+        if process.returncode == 0:
+            return True, parse_response_time(stdout.decode(errors='replace'), elapsed_time)
+        else:
+            return False, 0.0
+            
+    except Exception as e:
+        print(f"{host}: {e}")
+        return False, 0.0
+
+async def async_parallel_ping(hosts, timeout=2, max_concurrency=256):
+    semaphore = asyncio.Semaphore(max_concurrency)
     
-    def worker(host):
-        is_up, response_time = ping(host, timeout)
-        result_queue.put((host, is_up, response_time))
-    num_workers = min(max_workers, len(hosts))
-    threads = []
-    for host in hosts:
-        while len(threads) >= num_workers:
-            threads = [t for t in threads if t.is_alive()]
-            if len(threads) >= num_workers:
-                time.sleep(0.1)
-        
-        t = threading.Thread(target=worker, args=(host,))
-        t.daemon = True
-        t.start()
-        threads.append(t)
-    for t in threads:
-        t.join()
-    while not result_queue.empty():
-        host, is_up, response_time = result_queue.get()
-        results[host] = (is_up, response_time)
+    async def limited_ping(host):
+        async with semaphore:
+            return await async_ping(host, timeout)
     
-    return results
+    results = await asyncio.gather(*(limited_ping(host) for host in hosts))
+    return dict(zip(hosts, results))
+
+def parallel_ping(hosts, timeout=2, max_concurrency=256):
+    return asyncio.run(async_parallel_ping(hosts, timeout, max_concurrency))
+
+def parallel_hostnames(hosts, max_workers=64):
+    num_workers = min(max_workers, len(hosts))
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        return dict(zip(hosts, pool.map(get_hostname, hosts)))
 
 def format_time(ms):
     if ms < 1:
@@ -105,15 +155,22 @@ def format_time(ms):
 
 def monitor_hosts(hosts, interval=5, continuous=False, log_file=None, timeout=2, parallel=True):
     valid_hosts = []
+    seen = set()
     for host in hosts:
-        if validate_ip(host) or host.lower() == 'localhost':
-            valid_hosts.append(host)
+        if validate_ip(host):
+            if host not in seen:
+                seen.add(host)
+                valid_hosts.append(host)
         else:
             print(f"{Colors.YELLOW}Avviso: '{host}' non sembra un indirizzo IP valido. "
                   f"Tentativo di risoluzione...{Colors.ENDC}")
             try:
                 ip = socket.gethostbyname(host)
+                if ip in seen:
+                    print(f"{Colors.YELLOW}Risolto '{host}' in '{ip}', già monitorato.{Colors.ENDC}")
+                    continue
                 print(f"{Colors.GREEN}Risolto '{host}' in '{ip}'. Aggiunto al monitoraggio.{Colors.ENDC}")
+                seen.add(ip)
                 valid_hosts.append(ip)
             except socket.gaierror:
                 print(f"{Colors.RED}Errore: Ignoro '{host}'.{Colors.ENDC}")
@@ -127,7 +184,10 @@ def monitor_hosts(hosts, interval=5, continuous=False, log_file=None, timeout=2,
     statistics = {host: {"checks": 0, "up": 0, "down": 0, "total_response_time": 0} 
                  for host in valid_hosts}
     
-    hostnames = {host: get_hostname(host) for host in valid_hosts}
+    if parallel:
+        hostnames = parallel_hostnames(valid_hosts)
+    else:
+        hostnames = {host: get_hostname(host) for host in valid_hosts}
     
     def signal_handler(sig, frame):
         print("\n" + Colors.YELLOW + "Interruzione del monitoraggio..." + Colors.ENDC)
@@ -136,6 +196,7 @@ def monitor_hosts(hosts, interval=5, continuous=False, log_file=None, timeout=2,
     
     signal.signal(signal.SIGINT, signal_handler)
     
+    log_fh = None
     if log_file:
         log_dir = os.path.dirname(log_file)
         if log_dir and not os.path.exists(log_dir):
@@ -145,12 +206,13 @@ def monitor_hosts(hosts, interval=5, continuous=False, log_file=None, timeout=2,
                 print(f"{Colors.RED}Errore nella creazione della directory per il log: {e}{Colors.ENDC}")
                 log_file = None
         try:
-            with open(log_file, 'a') as f:
-                f.write(f"=== Sessione di monitoraggio iniziata il {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n")
-                f.write(f"Host monitorati: {', '.join(valid_hosts)}\n\n")
+            if log_file:
+                log_fh = open(log_file, 'a', buffering=1)
+                log_fh.write(f"=== Sessione di monitoraggio iniziata il {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n")
+                log_fh.write(f"Host monitorati: {', '.join(valid_hosts)}\n\n")
         except IOError as e:
             print(f"{Colors.RED}Errore nell'apertura del file di log: {e}{Colors.ENDC}")
-            log_file = None
+            log_fh = None
     
     try:
         count = 1
@@ -188,10 +250,9 @@ def monitor_hosts(hosts, interval=5, continuous=False, log_file=None, timeout=2,
                     message = f"{timestamp} - Host {host} è passato a {change}"
                     print(f"{Colors.YELLOW}* Cambio di stato: {message}{Colors.ENDC}")
                     
-                    if log_file:
+                    if log_fh:
                         try:
-                            with open(log_file, 'a') as f:
-                                f.write(f"{message}\n")
+                            log_fh.write(f"{message}\n")
                         except IOError as e:
                             print(f"{Colors.RED}Errore nella scrittura del log: {e}{Colors.ENDC}")
                 
@@ -209,10 +270,10 @@ def monitor_hosts(hosts, interval=5, continuous=False, log_file=None, timeout=2,
     finally:
         print_statistics(statistics, hostnames)
         
-        if log_file:
+        if log_fh:
             try:
-                with open(log_file, 'a') as f:
-                    f.write(f"\n=== Sessione di monitoraggio terminata il {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n\n")
+                log_fh.write(f"\n=== Sessione di monitoraggio terminata il {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===\n\n")
+                log_fh.close()
             except IOError:
                 pass
 